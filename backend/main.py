@@ -1,19 +1,34 @@
 # main.py
 import os
 import time
+import asyncio
 import json
-import shutil
+import multiprocessing
 import re
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple
 
+import httpx
 import numpy as np
-import requests
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Form
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from pydantic import BaseModel
 
-from utils.extractor import extract_text_from_pdf, split_text_into_chunks
-from utils.predictor import classify_chunks
+try:
+    import simsimd  # SIMD distance kernels; optional
+except ImportError:
+    simsimd = None
+
+try:
+    from numba import njit  # JIT for the single-pair cosine; optional
+except ImportError:
+    njit = None
+
+from utils.worker import init_worker, parse_resume, ping
+from utils.embed_cache import EmbedCache, text_key
 
 # -------------------------
 # Load environment variables from .env (local dev)
@@ -26,6 +41,8 @@ load_dotenv()
 # =========================
 AZURE_SCORING_URI = (os.getenv("AZURE_SCORING_URI") or "").strip()
 AZURE_PRIMARY_KEY = (os.getenv("AZURE_PRIMARY_KEY") or "").strip()
+# Optional model/deployment identifier; bump it when the model behind the URI changes
+AZURE_EMBED_MODEL = (os.getenv("AZURE_EMBED_MODEL") or "").strip()
 # "bearer" -> Authorization: Bearer <key>
 # "api-key" -> Authorization: <key> and api-key: <key>
 AZURE_AUTH_STYLE = (os.getenv("AZURE_AUTH_STYLE", "bearer") or "bearer").strip().lower()
@@ -49,6 +66,28 @@ def _validate_azure_env():
 
 _validate_azure_env()
 
+# Content-addressed embedding cache (endpoint/model + normalized text hash -> vector)
+EMBED_CACHE_PATH = (os.getenv("EMBED_CACHE_PATH") or "embed_cache.sqlite3").strip()
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES") or 100_000)
+EMBED_CACHE_NAMESPACE = f"{AZURE_SCORING_URI}#{AZURE_EMBED_MODEL}"
+# Unit vectors in [-1, 1] lose almost nothing in half precision, and it halves
+# cache size and memory traffic in the batched cosine
+EMBED_DTYPE = np.float16
+EMBED_CACHE = EmbedCache(EMBED_CACHE_PATH, dtype=EMBED_DTYPE, max_entries=EMBED_CACHE_MAX_ENTRIES)
+
+
+def _embed_key(text: str) -> bytes:
+    """Cache key for `text` under the current endpoint/model."""
+    return text_key(text, EMBED_CACHE_NAMESPACE)
+
+
+# Retry policy for Azure calls.
+# The scoring call is idempotent, so POST is retried on gateway errors.
+AZURE_RETRY_TOTAL = 3
+AZURE_RETRY_BACKOFF = 0.3
+AZURE_RETRY_STATUSES = (502, 503, 504)
+AZURE_TIMEOUT = 60
+
 
 def _headers():
     """Build auth headers compatible with your Azure endpoint."""
@@ -79,19 +118,13 @@ def _robust_json(text: str):
     return data
 
 
-def _embed(text: str, timeout: int = 60) -> np.ndarray:
+def _vector_from_response(r) -> np.ndarray:
     """
-    Call Azure endpoint to get an embedding for the given text.
+    Turn an Azure scoring response (httpx) into a unit-length EMBED_DTYPE vector.
     Handles cases where the service double-encodes JSON (string body containing JSON).
     Accepts either {"embedding":[...]} or a raw list vector.
     """
-    if not text:
-        # Return a small zero vector to avoid crashes; similarity will be 0
-        return np.zeros(1, dtype=np.float32)
-
-    payload = {"text": text}
-    r = requests.post(AZURE_SCORING_URI, headers=_headers(), json=payload, timeout=timeout)
-    if not r.ok:
+    if r.status_code >= 400:
         raise RuntimeError(f"Azure {r.status_code}: {r.text}")
 
     # Try proper JSON first
@@ -115,28 +148,150 @@ def _embed(text: str, timeout: int = 60) -> np.ndarray:
     else:
         raise RuntimeError(f"Azure response missing 'embedding': {str(data)[:300]}")
 
-    return np.array(vec, dtype=np.float32)
+    # L2-normalize once here so similarity downstream is a plain dot product
+    vec = np.array(vec, dtype=np.float32)
+    n = float(np.linalg.norm(vec))
+    if n:
+        vec = vec / n
+    return vec.astype(EMBED_DTYPE)
+
+
+def _async_azure_client(timeout: int = AZURE_TIMEOUT) -> httpx.AsyncClient:
+    """AsyncClient for Azure; the transport retries failed connects."""
+    transport = httpx.AsyncHTTPTransport(
+        retries=AZURE_RETRY_TOTAL,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    )
+    return httpx.AsyncClient(timeout=timeout, transport=transport)
+
+
+# One pooled keep-alive client shared by all requests; closed in lifespan()
+_azure_client = None
+
+
+def _get_azure_client() -> httpx.AsyncClient:
+    global _azure_client
+    if _azure_client is None or _azure_client.is_closed:
+        _azure_client = _async_azure_client()
+    return _azure_client
+
+
+async def _post_with_retry(client: httpx.AsyncClient, payload: dict) -> httpx.Response:
+    """POST to Azure, retrying gateway errors with exponential backoff."""
+    for attempt in range(AZURE_RETRY_TOTAL + 1):
+        r = await client.post(AZURE_SCORING_URI, json=payload, headers=_headers())
+        if r.status_code not in AZURE_RETRY_STATUSES or attempt == AZURE_RETRY_TOTAL:
+            return r
+        await asyncio.sleep(AZURE_RETRY_BACKOFF * (2 ** attempt))
+    return r
+
+
+async def _embed_async(client: httpx.AsyncClient, text: str, key: bytes = None) -> np.ndarray:
+    """
+    Call Azure endpoint to get an embedding for the given text.
+    Served from EMBED_CACHE when the same text was embedded before.
+    """
+    if not text:
+        # Return a small zero vector to avoid crashes; similarity will be 0
+        return np.zeros(1, dtype=EMBED_DTYPE)
+
+    # SQLite I/O goes to a thread so it doesn't block the event loop
+    key = key or _embed_key(text)
+    vec = await asyncio.to_thread(EMBED_CACHE.get, key)
+    if vec is not None:
+        return vec
+
+    payload = {"text": text}
+    r = await _post_with_retry(client, payload)
+    vec = _vector_from_response(r)
+    await asyncio.to_thread(EMBED_CACHE.put, key, vec)
+    return vec
+
+
+def _embed(text: str, timeout: int = AZURE_TIMEOUT, key: bytes = None) -> np.ndarray:
+    """Blocking wrapper around _embed_async, for callers outside the event loop."""
+    async def run():
+        async with _async_azure_client(timeout) as client:
+            return await _embed_async(client, text, key)
+    return asyncio.run(run())
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _dot_nb(a, b):
+        d = 0.0
+        for i in range(a.shape[0]):
+            d += a[i] * b[i]
+        return d
+
+    # Compile at import rather than on the first request
+    _dot_nb(np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.float32))
+else:
+    _dot_nb = None
+
+
+def _is_empty_placeholder(v: np.ndarray) -> bool:
+    """The size-1 zero vector _embed returns for empty text."""
+    return v.shape == (1,) and not v.any()
+
+
+def _check_dims(a: np.ndarray, b: np.ndarray) -> None:
+    if a.shape != b.shape:
+        raise RuntimeError(f"Embedding dimension mismatch: {a.shape} vs {b.shape}")
 
 
 def _cosine(a: np.ndarray, b: np.ndarray) -> float:
-    """Cosine similarity, safe for zero vectors."""
+    """Cosine similarity of two unit vectors from _embed; 0 for the empty-text placeholder."""
+    if _is_empty_placeholder(a) or _is_empty_placeholder(b):
+        return 0.0
+    _check_dims(a, b)
+    # Accumulate in float32; float16 dot has no BLAS path and loses precision
     a = a.astype(np.float32, copy=False)
     b = b.astype(np.float32, copy=False)
-    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
-    if denom == 0.0:
-        return 0.0
-    return float(np.dot(a, b) / denom)
+    d = _dot_nb(a, b) if _dot_nb is not None else np.dot(a, b)
+    return max(-1.0, min(1.0, float(d)))
+
+
+def _cosine_many(vecs: List[np.ndarray], q: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of every unit vector in `vecs` against unit `q` in one batched call.
+    The empty-text placeholder and zero rows score 0; any other dimension mismatch raises.
+    """
+    scores = np.zeros(len(vecs), dtype=np.float32)
+    if _is_empty_placeholder(q):
+        return scores
+    idx = []
+    for i, v in enumerate(vecs):
+        if not _is_empty_placeholder(v):
+            _check_dims(v, q)
+            idx.append(i)
+    if not idx or not q.any():
+        return scores
+    M = np.stack([vecs[i] for i in idx])
+
+    if simsimd is not None:
+        # SimSIMD has native f16 kernels; no upcast needed
+        dist = np.asarray(simsimd.cdist(M, q[None, :], metric="cosine")).reshape(-1)
+        sims = np.where(M.any(axis=1), 1.0 - dist, 0.0)
+    else:
+        sims = M.astype(np.float32) @ q.astype(np.float32)
+    scores[idx] = np.clip(sims, -1.0, 1.0)
+    return scores
 
 
 # ---------- Matching text prep (score only relevant sections) ----------
 SECTION_KEYS_FOR_MATCH = ["SUMMARY", "SKILLS", "EXPERIENCE", "PROJECTS"]
 
+# URLs go first, on their own: "foo@https://x" must keep "foo"
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+# Then one scan: emails | runs of anything that isn't a common tech char
+_CLEAN_RE = re.compile(r'\S+@\S+|[^a-z0-9\s+.#/+-]+')
+_SPACE_RE = re.compile(r'\s+')
+
 def _normalize_text(t: str) -> str:
-    t = t.lower()
-    t = re.sub(r'https?://\S+|www\.\S+', ' ', t)  # remove urls
-    t = re.sub(r'\S+@\S+', ' ', t)                # remove emails
-    t = re.sub(r'[^a-z0-9\s+.#/+-]', ' ', t)      # keep common tech chars
-    t = re.sub(r'\s+', ' ', t).strip()
+    t = _URL_RE.sub(' ', t.lower())  # remove urls
+    t = _CLEAN_RE.sub(' ', t)        # remove emails, keep common tech chars
+    t = _SPACE_RE.sub(' ', t).strip()
     return t
 
 def _text_for_matching(parsed: dict, raw_text: str) -> str:
@@ -150,19 +305,108 @@ def _text_for_matching(parsed: dict, raw_text: str) -> str:
     return _normalize_text("\n\n".join(parts))
 
 
-def call_azure_match(resume_text_for_match: str, jd_text_for_match: str):
+# Normalized texts shorter than this are treated as empty (score 0)
+MIN_MATCH_TEXT_LEN = 20
+
+
+async def call_azure_match(resume_text_for_match: str, jd_text_for_match: str):
     """
     Two-pass embedding (resume + JD) -> cosine similarity -> scale to [0, 10].
     Returns a rounded score (2 decimals).
     """
-    r_vec = _embed(resume_text_for_match)
-    j_vec = _embed(jd_text_for_match)
+    # Near-empty text on either side scores 0; don't spend Azure calls on it
+    if len(resume_text_for_match) < MIN_MATCH_TEXT_LEN or len(jd_text_for_match) < MIN_MATCH_TEXT_LEN:
+        return 0.0
+    client = _get_azure_client()
+    r_vec, j_vec = await asyncio.gather(
+        _embed_async(client, resume_text_for_match),
+        _embed_async(client, jd_text_for_match),
+    )
     score = _cosine(r_vec, j_vec) * 10.0
     score = max(0.0, min(10.0, float(score)))
     return round(score, 2)
 
 
-app = FastAPI()
+# Response models: FastAPI (>=0.130) dumps these straight to JSON bytes via pydantic-core
+class EnvCheckResponse(BaseModel):
+    uri_ok: bool
+    auth_style: str
+    key_set: bool
+
+
+class UploadResumeResponse(BaseModel):
+    status: str
+    extracted_data: Dict[str, str]
+
+
+class MatchResumeResponse(BaseModel):
+    status: str
+    parsed_resume: Dict[str, str]
+    match_score: float
+
+
+class BulkMatchRow(BaseModel):
+    filename: str
+    score: float
+
+
+class BulkMatchResponse(BaseModel):
+    status: str
+    matches: List[BulkMatchRow]
+
+
+# Max number of concurrent Azure embedding requests per /bulk-match call
+BULK_EMBED_CONCURRENCY = 5
+
+# PDF extraction + spaCy classification is CPU-bound; run it off the event loop
+PARSE_WORKERS = os.cpu_count()
+# Never fork the threaded server: workers start clean and, under `uvicorn main:app`,
+# import only utils.worker, without inheriting the SQLite cache, the Azure client or held locks
+if "forkserver" in multiprocessing.get_all_start_methods():
+    PARSE_MP_CONTEXT = multiprocessing.get_context("forkserver")
+    # The fork server imports spaCy/PyMuPDF once; workers fork from it already loaded
+    PARSE_MP_CONTEXT.set_forkserver_preload(["utils.worker"])
+else:
+    PARSE_MP_CONTEXT = multiprocessing.get_context("spawn")
+_parse_executor = None
+
+
+def _get_parse_executor() -> ProcessPoolExecutor:
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS, mp_context=PARSE_MP_CONTEXT, initializer=init_worker
+        )
+    return _parse_executor
+
+
+async def _parse_pdf(pdf_bytes: bytes) -> Tuple[str, dict]:
+    global _parse_executor
+    executor = _get_parse_executor()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, parse_resume, pdf_bytes)
+    except BrokenProcessPool:
+        # A worker died (MuPDF crash, OOM kill); drop the pool so the next call gets a fresh one
+        if _parse_executor is executor:
+            _parse_executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise HTTPException(status_code=500, detail="Resume parser worker crashed while parsing the PDF.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the workers (and their spaCy load) before the first request arrives
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_get_parse_executor(), ping)
+    yield
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+    if _azure_client is not None:
+        await _azure_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS (allow all for now; lock down in production)
 app.add_middleware(
@@ -174,25 +418,39 @@ app.add_middleware(
 )
 
 
-def _save_temp(upload: UploadFile, prefix: str) -> str:
-    path = f"temp_{prefix}_{upload.filename}"
-    with open(path, "wb") as buffer:
-        shutil.copyfileobj(upload.file, buffer)
-    return path
+# Upload limits, checked before any parsing work
+MAX_UPLOAD_BYTES = 10 << 20  # 10 MiB per PDF
+PDF_SIGNATURE = b"%PDF-"
 
 
-def _cleanup(paths: List[str]) -> None:
-    for p in paths:
-        try:
-            os.remove(p)
-        except FileNotFoundError:
-            pass
+async def _read_upload(upload: UploadFile, chunk_size: int = 1 << 20) -> bytes:
+    """
+    Read the uploaded PDF into memory; PyMuPDF opens it straight from the buffer.
+    Rejects non-PDF, empty and oversize uploads before they reach the parser.
+    The declared content type is ignored: clients often label PDFs as
+    application/octet-stream or application/x-pdf, so the file signature decides.
+    """
+    buf = bytearray()
+    while chunk := await upload.read(chunk_size):
+        if not buf and not chunk.startswith(PDF_SIGNATURE):
+            # Checked on the first chunk so non-PDFs are never read in full
+            raise HTTPException(status_code=400, detail=f"{upload.filename}: not a PDF file")
+        buf += chunk
+        if len(buf) > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{upload.filename}: larger than {MAX_UPLOAD_BYTES} bytes",
+            )
+
+    if not buf:
+        raise HTTPException(status_code=400, detail=f"{upload.filename}: empty file")
+    return bytes(buf)
 
 
 # --------------------------------------------
 # Health/debug (safe)
 # --------------------------------------------
-@app.get("/_env_check")
+@app.get("/_env_check", response_model=EnvCheckResponse)
 def env_check():
     # Don’t leak secrets
     return {
@@ -205,80 +463,107 @@ def env_check():
 # --------------------------------------------
 # Parsing endpoint (supports both URLs)
 # --------------------------------------------
-@app.post("/upload-resume")
-@app.post("/upload-resume/")
+@app.post("/upload-resume", response_model=UploadResumeResponse)
+@app.post("/upload-resume/", response_model=UploadResumeResponse)
 async def upload_resume(file: UploadFile = File(...)):
-    pdf_path = _save_temp(file, "resume")
-    try:
-        text = extract_text_from_pdf(pdf_path)
-        chunks = split_text_into_chunks(text)
-        predictions = classify_chunks(chunks)
-        return {"status": "success", "extracted_data": predictions}
-    finally:
-        _cleanup([pdf_path])
+    pdf_bytes = await _read_upload(file)
+    _, predictions = await _parse_pdf(pdf_bytes)
+    return {"status": "success", "extracted_data": predictions}
 
 
 # --------------------------------------------
 # Single JD + Resume matching (jd_text as plain text)
 # --------------------------------------------
-@app.post("/match-resume-jd")
-@app.post("/match-resume-jd/")
+@app.post("/match-resume-jd", response_model=MatchResumeResponse)
+@app.post("/match-resume-jd/", response_model=MatchResumeResponse)
 async def match_resume_jd(
     resume: UploadFile = File(...),
     jd_text: str = Form(...),
 ):
-    resume_path = _save_temp(resume, "single")
     try:
-        resume_text_raw = extract_text_from_pdf(resume_path)
-        parsed = classify_chunks(split_text_into_chunks(resume_text_raw))
+        resume_bytes = await _read_upload(resume)
+        resume_text_raw, parsed = await _parse_pdf(resume_bytes)
 
         resume_text = _text_for_matching(parsed, resume_text_raw)
         jd_text_norm = _normalize_text(jd_text)
 
-        score = call_azure_match(resume_text, jd_text_norm)
+        score = await call_azure_match(resume_text, jd_text_norm)
 
         return {
             "status": "success",
             "parsed_resume": parsed,
             "match_score": score,  # rounded to 2 decimals
         }
+    except HTTPException:
+        raise
     except Exception as e:
         # Bubble up exact reason (no secrets)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        _cleanup([resume_path])
 
 
 # --------------------------------------------
 # Bulk matching: multiple resumes + 1 JD (jd_text as plain text)
 # Returns only results with score >= min_score
 # --------------------------------------------
-@app.post("/bulk-match")
-@app.post("/bulk-match/")
+@app.post("/bulk-match", response_model=BulkMatchResponse)
+@app.post("/bulk-match/", response_model=BulkMatchResponse)
 async def bulk_match(
     jd_text: str = Form(...),
     resumes: List[UploadFile] = File(...),
     min_score: float = Query(7.0, ge=0.0),
 ):
-    resume_paths = []
     try:
         jd_text_norm = _normalize_text(jd_text)
-        # Precompute JD embedding once
-        jd_vec = _embed(jd_text_norm)
+        # Hash the JD once; repeat postings hit the cache instead of Azure
+        jd_key = _embed_key(jd_text_norm)
+
+        resume_bytes = [await _read_upload(upload) for upload in resumes]
+
+        # Parse all resumes in parallel across worker processes
+        parsed_all = await asyncio.gather(*[_parse_pdf(b) for b in resume_bytes])
+        r_texts = [_text_for_matching(parsed, raw) for raw, parsed in parsed_all]
+
+        # Coalesce identical resume texts: one embedding per unique hash.
+        # Near-empty resumes (or a near-empty JD) are left out and score 0.
+        groups: Dict[bytes, List[int]] = {}
+        if len(jd_text_norm) >= MIN_MATCH_TEXT_LEN:
+            for i, t in enumerate(r_texts):
+                if len(t) >= MIN_MATCH_TEXT_LEN:
+                    groups.setdefault(_embed_key(t), []).append(i)
+        unique_keys = list(groups)
+
+        jd_vec = np.zeros(1, dtype=EMBED_DTYPE)
+        unique_vecs = []
+        if unique_keys:
+            # Keep several embedding requests in flight, bounded by BULK_EMBED_CONCURRENCY
+            sem = asyncio.Semaphore(BULK_EMBED_CONCURRENCY)
+
+            client = _get_azure_client()
+
+            async def embed_one(text: str, key: bytes = None) -> np.ndarray:
+                async with sem:
+                    return await _embed_async(client, text, key)
+
+            # JD embedding computed once, alongside the resumes
+            jd_vec, *unique_vecs = await asyncio.gather(
+                embed_one(jd_text_norm, jd_key),
+                *[embed_one(r_texts[groups[k][0]], k) for k in unique_keys],
+            )
+
+        # Broadcast each unique vector back to every resume that shares it;
+        # skipped resumes keep the zero placeholder
+        r_vecs = [np.zeros(1, dtype=EMBED_DTYPE)] * len(r_texts)
+        for k, vec in zip(unique_keys, unique_vecs):
+            for i in groups[k]:
+                r_vecs[i] = vec
+
+        # All resume-vs-JD similarities in a single GEMV
+        sims = _cosine_many(r_vecs, jd_vec)
 
         results = []
-        for upload in resumes:
-            path = _save_temp(upload, "bulk")
-            resume_paths.append(path)
-
-            raw = extract_text_from_pdf(path)
-            parsed = classify_chunks(split_text_into_chunks(raw))
-            r_text = _text_for_matching(parsed, raw)
-
-            r_vec = _embed(r_text)
-
-            score = _cosine(r_vec, jd_vec) * 10.0
-            score = max(0.0, min(10.0, float(score)))
+        for upload, sim in zip(resumes, sims):
+            score = float(sim) * 10.0
+            score = max(0.0, min(10.0, score))
             score = round(score, 2)
 
             if score >= min_score:
@@ -287,7 +572,7 @@ async def bulk_match(
         results.sort(key=lambda x: x["score"], reverse=True)
 
         return {"status": "success", "matches": results}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        _cleanup(resume_paths)
@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+
+import blake3
+import numpy as np
+
+
+def text_key(text, namespace=""):
+    """
+    Content address for a (normalized) text: blake3 digest of its UTF-8 bytes.
+    `namespace` identifies the embedding endpoint/model, so vectors from a
+    different model never share a key.
+    """
+    h = blake3.blake3(namespace.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.digest()
+
+
+class EmbedCache:
+    """
+    Persistent hash -> unit-length vector store backed by SQLite.
+    Vectors are stored as raw `dtype` bytes (float16 by default) alongside their dimension.
+    Holds at most `max_entries` rows; the oldest-written rows are evicted first.
+    """
+
+    def __init__(self, path, dtype=np.float16, max_entries=100_000):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+        # One connection per thread: with WAL, readers don't wait on a writer
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS unit_embeddings ("
+            "hash BLOB PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            # WAL + NORMAL: a commit per put doesn't fsync every time
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT dim, vec FROM unit_embeddings WHERE hash = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        dim, blob = row
+        if len(blob) != dim * self.dtype.itemsize:
+            return None  # other dtype or truncated row; treat as a miss
+        return np.frombuffer(blob, dtype=self.dtype)
+
+    def put(self, key, vec):
+        vec = np.asarray(vec, dtype=self.dtype)
+        # One write transaction; SQLite serializes concurrent writers (busy timeout above)
+        with self._conn() as conn:
+            # REPLACE re-inserts with a fresh rowid, so rowid order is write order
+            conn.execute(
+                "INSERT OR REPLACE INTO unit_embeddings (hash, dim, vec) VALUES (?, ?, ?)",
+                (key, int(vec.shape[0]), vec.tobytes()),
+            )
+            conn.execute(
+                "DELETE FROM unit_embeddings WHERE rowid <= "
+                "(SELECT MAX(rowid) FROM unit_embeddings) - ?",
+                (self.max_entries,),
+            )
@@ -1,26 +1,35 @@
 import fitz  # PyMuPDF
 import re
 
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text()
-    return full_text.strip()
+def extract_text_from_pdf(pdf_bytes):
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        parts = [page.get_text("text", sort=False) for page in doc]
+    finally:
+        doc.close()
+    return "".join(parts).strip()
 
-def split_text_into_chunks(text):
-    section_titles = [
-        "Summary", "Professional Summary", "Education", "Certifications", "Skills",
-        "Experience", "Projects", "Awards", "Accomplishments", "Interests",
-        "Languages", "Technical Skills", "Internship Experience"
-    ]
-    pattern = r"(?i)\b(" + "|".join(re.escape(title) for title in section_titles) + r")\b[:\n]?"
+SECTION_TITLES = [
+    "Summary", "Professional Summary", "Education", "Certifications", "Skills",
+    "Experience", "Projects", "Awards", "Accomplishments", "Interests",
+    "Languages", "Technical Skills", "Internship Experience"
+]
+_SECTION_RE = re.compile(
+    r"\b(" + "|".join(re.escape(title) for title in SECTION_TITLES) + r")\b[:\n]?",
+    re.IGNORECASE,
+)
 
-    chunks = re.split(pattern, text)
+def split_text_into_chunks(text):
     paired_chunks = []
-    for i in range(1, len(chunks), 2):
-        section = chunks[i].strip().upper()
-        content = chunks[i+1].strip() if i + 1 < len(chunks) else ""
+    section, start = None, 0
+    for m in _SECTION_RE.finditer(text):
+        if section is not None:
+            content = text[start:m.start()].strip()
+            if len(content) > 20:
+                paired_chunks.append((section, content))
+        section, start = m.group(1).strip().upper(), m.end()
+    if section is not None:
+        content = text[start:].strip()
         if len(content) > 20:
             paired_chunks.append((section, content))
     return paired_chunks
@@ -1,13 +1,31 @@
 import spacy
 from collections import defaultdict
 import os
-nlp = spacy.load(os.path.join(os.path.dirname(__file__), "..", "model", "model-best"))
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "model", "model-best")
+# classify_chunks only reads doc.cats
+REQUIRED_PIPES = ("tok2vec", "textcat")
+_nlp = None
+
+
+def get_nlp():
+    # Loaded on first use so each worker process loads its own copy
+    global _nlp
+    if _nlp is None:
+        nlp = spacy.load(MODEL_PATH)
+        if "textcat" not in nlp.pipe_names:
+            raise RuntimeError(f"spaCy model at {MODEL_PATH} has no textcat component")
+        for name in nlp.pipe_names:
+            if name not in REQUIRED_PIPES:
+                nlp.disable_pipe(name)
+        _nlp = nlp
+    return _nlp
 
 
 def classify_chunks(chunks, threshold=0.5):
+    nlp = get_nlp()
     results = defaultdict(list)
-    for _, chunk in chunks:
-        doc = nlp(chunk)
+    texts = [chunk for _, chunk in chunks]
+    for chunk, doc in zip(texts, nlp.pipe(texts, batch_size=32)):
         scores = doc.cats
         best_label = max(scores, key=scores.get)
         if scores[best_label] >= threshold:
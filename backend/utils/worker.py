@@ -0,0 +1,20 @@
+# Entry points for the resume-parsing process pool. Kept out of main.py so
+# spawn/forkserver workers import only the parsing code, not the API app.
+from utils.extractor import extract_text_from_pdf, split_text_into_chunks
+from utils.predictor import classify_chunks, get_nlp
+
+
+def init_worker():
+    # Load spaCy once when the worker starts, not inside the first request
+    get_nlp()
+
+
+def ping():
+    return True
+
+
+def parse_resume(pdf_bytes):
+    """PDF bytes -> (raw text, classified sections)."""
+    raw = extract_text_from_pdf(pdf_bytes)
+    parsed = classify_chunks(split_text_into_chunks(raw))
+    return raw, parsed